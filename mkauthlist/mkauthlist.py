@@ -33,17 +33,26 @@ except:
 
 import os,sys
 import csv
-from collections import OrderedDict as odict
-import copy
+import io
 import re
 import logging
 
 import numpy as np
 
+# Unescaped LaTeX tilde (used when converting names to plain text)
+TILDE = re.compile(r'(?<!\\)~')
+# Deletes LaTeX grouping braces in a single pass
+BRACES = str.maketrans('', '', '{}')
+# The unescaped umlaut pattern: \" not followed by another " (the
+# consuming form avoids a lookahead; only match presence is tested)
+UMLAUT = re.compile(r'\\"(?:[^"]|$)')
+# A quoted-string start (,") or an unescaped umlaut, whichever comes first
+QUOTE_OR_UMLAUT = re.compile(r'(,")|\\"(?:[^"]|$)')
+
 #MUNICH HACK (shouldn't be necessary any more)
-HACK = odict([
-    #('Ludwig-Maximilians-Universit',r'Department of Physics, Ludwig-Maximilians-Universit\"at, Scheinerstr.\ 1, 81679 M\"unchen, Germany')
-])
+HACK = {
+    #'Ludwig-Maximilians-Universit':r'Department of Physics, Ludwig-Maximilians-Universit\"at, Scheinerstr.\ 1, 81679 M\"unchen, Germany'
+}
 
 def check_umlaut(lines):
     """Check for unescaped umlaut characters in quoted strings."""
@@ -52,16 +61,16 @@ def check_umlaut(lines):
     #While this is not:
     #  Gruen,Daniel,D.~Gr\"un,...
 
-    # The unescaped umlaut pattern: \" and not \""
-    umlaut = re.compile(r'\\"(?!")')
-    # The start of a quoted string: ,"
-    quote = re.compile(r',"')
-
     for line in lines:
-        if umlaut.search(line) is None or quote.search(line) is None: continue
-        if umlaut.search(line).start() > quote.search(line).start():
-            msg =  "Found unescaped umlaut: " + line.strip()
-            logging.warn(msg)
+        # Fast substring test before invoking the regex engine
+        if '\\"' not in line: continue
+        # A single scan finds whichever comes first; only a quote start
+        # followed by an umlaut is a problem
+        m = QUOTE_OR_UMLAUT.search(line)
+        if m is None or m.group(1) is None: continue
+        if UMLAUT.search(line, m.end()) is None: continue
+        msg =  "Found unescaped umlaut: " + line.strip()
+        logging.warn(msg)
     return lines
 
 def get_builders(data):
@@ -79,7 +88,8 @@ def get_builders(data):
 def get_firsttier(data):
     """ Get a boolean array of the authors that are first tier. """
     if 'FirstTier' in data.dtype.names:
-        firsttiers = (np.char.lower(data['FirstTier']) != '')
+        # Lowercasing cannot change whether the entry is empty
+        firsttiers = (data['FirstTier'] != '')
     else:
         msg = "No first tier column found."
 #        raise ValueError(msg)
@@ -94,46 +104,45 @@ def write_contributions(filename,data):
         logging.error("No 'Contribution' field.")
         raise Exception()
 
-    cntrbdict = odict()
+    cntrbdict = {}
     for i,d in enumerate(data):
         if cntrbdict.get(d['Authorname'],d['Contribution']) != d['Contribution']:
-            logging.warn("Non-unique contribution for '%(Authorname)s'"%d)
+            logging.warn("Non-unique contribution for '%s'",d['Authorname'])
 
         cntrbdict[d['Authorname']]=d['Contribution']
 
-    output = r'Author contributions are listed below. \\'+'\n'
-    for i,(name,cntrb) in enumerate(cntrbdict.items()):
+    lines = [r'Author contributions are listed below. \\'+'\n']
+    for name,cntrb in cntrbdict.items():
         if cntrb == '':
-            logging.warn("Blank contribution for '%s'"%name)
-
-        output += r'%s: %s \\'%(name,cntrb) + '\n'
-
-    logging.info('Writing contribution file: %s'%filename)
-
-    out = open(filename,'w')
-    out.write(output)
-    out.close()
-
-
-journal2class = odict([
-    ('tex','aastex6'),
-    ('revtex','revtex'),
-    ('prl','revtex'),
-    ('prd','revtex'),
-    ('aastex','aastex6'),     # This is for aastex v6.*
-    ('aastex5','aastex'),     # This is for aastex v5.*
-    ('aastex61','aastex6'),   # This is for aastex v6.1
-    ('apj','aastex6'),
-    ('apjl','aastex6'),
-    ('aj','aastex6'),
-    ('mnras','mnras'),
-    ('elsevier','elsevier'),
-    ('jcap','jcap'),
-    ('jcap.appendix','jcap.appendix'),
-    ('emulateapj','emulateapj'),
-    ('arxiv','arxiv'),
-    ('aanda', 'aanda')
-])
+            logging.warn("Blank contribution for '%s'",name)
+
+        lines.append(r'%s: %s \\'%(name,cntrb) + '\n')
+
+    logging.info('Writing contribution file: %s',filename)
+
+    with open(filename,'w') as out:
+        out.writelines(lines)
+
+
+journal2class = {
+    'tex':'aastex6',
+    'revtex':'revtex',
+    'prl':'revtex',
+    'prd':'revtex',
+    'aastex':'aastex6',     # This is for aastex v6.*
+    'aastex5':'aastex',     # This is for aastex v5.*
+    'aastex61':'aastex6',   # This is for aastex v6.1
+    'apj':'aastex6',
+    'apjl':'aastex6',
+    'aj':'aastex6',
+    'mnras':'mnras',
+    'elsevier':'elsevier',
+    'jcap':'jcap',
+    'jcap.appendix':'jcap.appendix',
+    'emulateapj':'emulateapj',
+    'arxiv':'arxiv',
+    'aanda':'aanda',
+}
 
 defaults = dict(
     title = "Publication Title",
@@ -337,7 +346,7 @@ aanda_document = r"""
 """
 
 
-if __name__ == "__main__":
+def main():
     import argparse
     description = __doc__
     formatter = argparse.RawDescriptionHelpFormatter
@@ -387,64 +396,83 @@ if __name__ == "__main__":
 
     defaults['collaboration'] = args.collab
 
-    readlines = open(args.infile).readlines()
+    with open(args.infile) as infile:
+        text = infile.read()
     # Check for unescaped umlauts
-    lines = check_umlaut(readlines)
-    rows = []
-    for arow in csv.reader(lines, skipinitialspace=True):
-        if len(arow)!=0 and not arow[0].startswith('#'):
-            rows.append(arow)
+    # Keep the line endings so quoted fields spanning lines still parse
+    lines = check_umlaut(text.splitlines(keepends=True))
+    rows = [row for row in csv.reader(lines, skipinitialspace=True)
+            if row and not row[0].startswith('#')]
 
     data = np.rec.fromrecords(rows[1:], names=rows[0])
+    # Normalize whitespace once so affiliations group consistently
+    data['Affiliation'] = np.char.strip(data['Affiliation'])
 
     isbuilder  = get_builders(data)
-    builder    = data[isbuilder]
-    nonbuilder = data[~isbuilder]
+
+    # Uppercase sort keys are computed once (np.char.upper loops over
+    # every string).  The reorderings below are all expressed as
+    # permutations of the row indices, so the record array itself is
+    # fancy-indexed a single time at the end.
+    upper_first = np.char.upper(data['Firstname'])
+    upper_last  = np.char.upper(data['Lastname'])
+
+    b_perm  = np.flatnonzero(isbuilder)
+    nb_perm = np.flatnonzero(~isbuilder)
 
     if args.sort_builder:
-        idx = np.lexsort((np.char.upper(builder['Firstname']),
-                          np.char.upper(builder['Lastname'])))
-        builder = builder[idx]
+        b_perm = b_perm[np.lexsort((upper_first[b_perm],upper_last[b_perm]))]
 
     if args.sort_nonbuilder:
-        idx = np.lexsort((np.char.upper(nonbuilder['Firstname']),
-                          np.char.upper(nonbuilder['Lastname'])))
-        nonbuilder = nonbuilder[idx]
-
-    data = np.hstack([nonbuilder,builder])
+        nb_perm = nb_perm[np.lexsort((upper_first[nb_perm],upper_last[nb_perm]))]
 
+    perm = np.concatenate([nb_perm,b_perm])
 
     if args.sort_firsttier:
-        isfirsttier  = get_firsttier(data)
-        firsttier    = data[isfirsttier]
-        nonfirsttier = data[~isfirsttier]
-
-        idx = np.lexsort((np.char.upper(nonfirsttier['Firstname']),
-                          np.char.upper(nonfirsttier['Lastname'])))
-        nonfirsttier = nonfirsttier[idx]
-
-        idx = np.lexsort((np.char.upper(firsttier['Lastname']),
-                          np.char.upper(firsttier['FirstTier'])))
-        firsttier = firsttier[idx]
-
-        data = np.hstack([firsttier,nonfirsttier])
-
+        isfirsttier = get_firsttier(data)[perm]
+        ft_perm = perm[isfirsttier]
+        nf_perm = perm[~isfirsttier]
+
+        nf_perm = nf_perm[np.lexsort((upper_first[nf_perm],upper_last[nf_perm]))]
+
+        # Sort on the numeric rank; a string sort would put '10' before '2'
+        ft_tier = data['FirstTier'][ft_perm].tolist()
+        try:
+            ft_rank = np.fromiter((int(x) for x in ft_tier),
+                                  dtype=int, count=len(ft_tier))
+        except ValueError:
+            # Report the offending entry instead of a raw traceback
+            names = data['Authorname'][ft_perm]
+            for i,x in enumerate(ft_tier):
+                try:
+                    int(x)
+                except ValueError:
+                    msg = "Non-numeric FirstTier '%s' for '%s'"%(x,names[i])
+                    logging.error(msg)
+                    raise ValueError(msg) from None
+            raise
+        ft_perm = ft_perm[np.lexsort((upper_last[ft_perm], ft_rank))]
+
+        perm = np.concatenate([ft_perm,nf_perm])
 
     if args.sort:
-        idx = np.lexsort((np.char.upper(data['Firstname']),
-                          np.char.upper(data['Lastname'])))
-        data = data[idx]
-        #data = data[np.argsort(np.char.upper(data['Lastname']))]
+        perm = perm[np.lexsort((upper_first[perm],upper_last[perm]))]
+
+    data = data[perm]
 
     cls = journal2class[args.journal.lower()]
-    affidict = odict()
-    authdict = odict()
+    is_arxiv = (cls == 'arxiv')
+    is_jcap_appendix = (cls == 'jcap.appendix')
+    affidict = {}
+    authdict = {}
 
     # Hack for umlauts in affiliations...
-    for k, v in HACK.items():
-        logging.warn("Hacking '%s' ..."%k)
-        select = (np.char.count(data['Affiliation'],k) > 0)
-        data['Affiliation'][select] = v
+    if HACK:
+        for k, v in HACK.items():
+            logging.warn("Hacking '%s' ...",k)
+            # find stops at the first hit; count scans the whole string
+            select = (np.char.find(data['Affiliation'],k) >= 0)
+            data['Affiliation'][select] = v
 
     # Pre-sort the csv file by the auxiliary file
     if args.aux is not None:
@@ -452,49 +480,71 @@ if __name__ == "__main__":
         # aux = [[r[c] for c in auxcols] for r in
         #        csv.DictReader(open(args.aux),fieldnames=auxcols)
         #        if not r[auxcols[0]].startswith('#')]
+        with open(args.aux) as auxfile:
+            aux_text = auxfile.read()
         aux = []
-        for r in csv.DictReader(open(args.aux), fieldnames=auxcols):
+        for r in csv.DictReader(io.StringIO(aux_text), fieldnames=auxcols):
             if not r[auxcols[0]].startswith('#'):
                 aux.append([r[c] for c in auxcols])
 
         aux = np.rec.fromrecords(aux,names=auxcols)
-        if len(np.unique(aux)) != len(aux):
-            logging.error('Non-unique names in aux file.')
-            print(open(args.aux).read())
+        seen = set()
+        dupes = []
+        for name in zip(aux['Lastname'],aux['Firstname']):
+            if name in seen:
+                dupes.append(', '.join(str(n) for n in name if n))
+            else:
+                seen.add(name)
+        if dupes:
+            logging.error('Non-unique names in aux file: %s','; '.join(dupes))
+            print(aux_text)
             raise Exception()
 
-        # This is probably not the cleanest way to do this...
-        raw_auth = [data['Lastname'],data['Firstname'],np.arange(len(data))]
-        raw = np.vstack(raw_auth).T
+        # Map each last name to its row indices (in order of appearance)
+        # so that aux entries resolve with a dict lookup instead of a
+        # full scan of the remaining rows.
+        firstnames = data['Firstname']
+        idx_by_last = {}
+        for i,lastname in enumerate(data['Lastname']):
+            idx_by_last.setdefault(lastname,[]).append(i)
 
-        order = np.empty((0, raw.shape[-1]), dtype=raw.dtype)
+        used = np.zeros(len(data), dtype=bool)
+        order_idx = []
         for r in aux:
             lastname = r['Lastname'].strip()
             firstname = r['Firstname']
-            match = (raw[:,0] == lastname)
+            match = [i for i in idx_by_last.get(lastname,[]) if not used[i]]
 
             if firstname:
                 firstname = r['Firstname'].strip()
-                match &= (raw[:,1] == firstname)
+                match = [i for i in match if firstnames[i] == firstname]
 
             # Check that match found
-            if np.sum(match) < 1:
+            if len(match) < 1:
                 msg = "Auxiliary name not found: %s"%(lastname)
                 if firstname: msg += ', %s'%firstname
                 logging.warn(msg)
                 continue
 
             # Check unique firstname
-            if not len(np.unique(raw[match][:,1])) == 1:
+            if len(set(firstnames[i] for i in match)) != 1:
                 msg = "Non-unique name: %s"%(lastname)
                 if firstname: msg += ', %s'%firstname
                 logging.error(msg)
                 raise ValueError(msg)
 
-            order = np.vstack([order,raw[match]])
-            raw = raw[~match]
-        order = np.vstack([order,raw])
-        data = data[order[:,-1].astype(int)]
+            order_idx.extend(match)
+            used[match] = True
+        order_idx.extend(np.flatnonzero(~used))
+        data = data[np.asarray(order_idx)]
+
+    # Warn about blank entries once, up front, rather than checking
+    # row-by-row inside every journal branch.
+    for i in np.flatnonzero(data['Affiliation'] == ''):
+        logging.warn("Blank affiliation for '%s'",data['Authorname'][i])
+    for i in np.flatnonzero(data['Authorname'] == ''):
+        logging.warn("Blank authorname for '%s %s'",data['Firstname'][i],
+                     data['Lastname'][i])
 
     ### REVTEX ###
     if cls in ['revtex','aastex6']:
@@ -508,35 +558,24 @@ if __name__ == "__main__":
             msg = "Unrecognized latex class: %s"%cls
             raise Exception(msg)
 
-        for i,d in enumerate(data):
-            if d['Affiliation'] == '':
-                logging.warn("Blank affiliation for '%s'"%d['Authorname'])
-            if d['Authorname'] == '':
-                logging.warn("Blank authorname for '%s %s'"%(d['Firstname'],
-                                                             d['Lastname']))
+        orcid = args.orcid
+        names = data['Authorname'].tolist()
+        affs  = data['Affiliation'].tolist()
+        orcids = data['ORCID'].tolist() if orcid else ['']*len(data)
+        for name,aff,oid in zip(names,affs,orcids):
+            authorkey = '{%s}'%(name)
 
-            authorkey = '{%s}'%(d['Authorname'])
+            if oid:
+                authorkey = '[%s]'%oid + authorkey
 
-            if args.orcid and d['ORCID']:
-                authorkey = '[%s]'%d['ORCID'] + authorkey
-
-            if authorkey not in authdict.keys():
-                authdict[authorkey] = [d['Affiliation']]
-            else:
-                authdict[authorkey].append(d['Affiliation'])
-            #if d['Authorname'] not in authdict.keys():
-            #    authdict[d['Authorname']] = [d['Affiliation']]
-            #else:
-            #    authdict[d['Authorname']].append(d['Affiliation'])
+            authdict.setdefault(authorkey,[]).append(aff)
 
         authors = []
         for key,val in authdict.items():
-            #author = r'\author{%s}'%key+'\n'
-            author = r'\author%s'%key+'\n'
-            for v in val:
-                author += r'\affiliation{%s}'%v+'\n'
-            author += '\n'
-            authors.append(author)
+            parts = [r'\author%s'%key+'\n']
+            parts += [r'\affiliation{%s}'%v+'\n' for v in val]
+            parts.append('\n')
+            authors.append(''.join(parts))
         params = dict(defaults,authors=''.join(authors))
 
     ### Separate author and affiliation ###
@@ -565,28 +604,22 @@ if __name__ == "__main__":
             msg = "Unrecognized latex class: %s"%cls
             raise Exception(msg)
 
-        for iauth, dat_auth in enumerate(data):
-            print(dat_auth['Authorname'])
-            if dat_auth['Affiliation'] == '':
-                logging.warn("Blank affiliation for '%s'"%dat_auth['Authorname'])
-            if dat_auth['Authorname'] == '':
-                logging.warn("Blank authorname for '%s %s'"%(dat_auth['Firstname'],
-                                                             dat_auth['Lastname']))
-
-            if (dat_auth['Affiliation'] not in affidict.keys()):
-                affidict[dat_auth['Affiliation']] = len(affidict.keys())
-            affidx = affidict[dat_auth['Affiliation']]
+        names = data['Authorname'].tolist()
+        affs  = data['Affiliation'].tolist()
+        for name,aff in zip(names,affs):
+            logging.debug(name)
+            affidx = affidict.setdefault(aff, len(affidict))
 
-            if dat_auth['Authorname'] not in authdict.keys():
-                authdict[dat_auth['Authorname']] = [affidx]
-            else:
-                authdict[dat_auth['Authorname']].append(affidx)
+            authdict.setdefault(name,[]).append(affidx)
 
         affiliations = []
         authors=[]
+        nauthors = len(authdict)
+        # Affiliation indices repeat across authors; stringify each once
+        idxstr = [str(i+args.idx) for i in range(len(affidict))]
         for i, (k,v) in enumerate(authdict.items()):
-            affmark = affilmark%(','.join([str(_v+args.idx) for _v in v]))
-            if i+1==len(authdict):
+            affmark = affilmark%(','.join(idxstr[_v] for _v in v))
+            if i+1==nauthors:
                 # Strip trailing comma from last entry (note MNRAS comma position)
                 affmark = affmark.strip(',')
                 # Prefix 'and' on last entry (seems robust)
@@ -595,17 +628,15 @@ if __name__ == "__main__":
             authors.append(author)
 
         if cls == 'aanda':
-            for k, v in affidict.items():
-                institution = k.rstrip(' ').lstrip(' ')
-                if institution == '':
-                    pass #continue
-                affiliation = affiltext%(institution)
-                if v == 0:
+            for i, k in enumerate(affidict):
+                # Affiliations are stripped at load time
+                affiliation = affiltext%(k)
+                if i == 0:
                     affiliation = affiliation.lstrip('\\and ')
                 affiliations.append(affiliation)
         else:
-            for k,v in affidict.items():
-                affiliation = affiltext%(v+args.idx,k)
+            for i, k in enumerate(affidict, args.idx):
+                affiliation = affiltext%(i,k)
                 affiliations.append(affiliation)
 
         params = dict(defaults,authors='\n'.join(authors),affiliations='\n'.join(affiliations))
@@ -616,30 +647,22 @@ if __name__ == "__main__":
         authlist = elsevier_authlist
         affilmark = r'%i,'
         affiltext = r'\address[%i]{%s}'
-        for i,d in enumerate(data):
-            if d['Affiliation'] == '':
-                logging.warn("Blank affiliation for '%s'"%d['Authorname'])
-            if d['Authorname'] == '':
-                logging.warn("Blank authorname for '%s %s'"%(d['Firstname'],
-                                                             d['Lastname']))
-
-            if (d['Affiliation'] not in affidict.keys()):
-                affidict[d['Affiliation']] = len(affidict.keys())
-            affidx = affidict[d['Affiliation']]
-
-            if d['Authorname'] not in authdict.keys():
-                authdict[d['Authorname']] = [affidx]
-            else:
-                authdict[d['Authorname']].append(affidx)
+        names = data['Authorname'].tolist()
+        affs  = data['Affiliation'].tolist()
+        for name,aff in zip(names,affs):
+            affidx = affidict.setdefault(aff, len(affidict))
+
+            authdict.setdefault(name,[]).append(affidx)
 
         affiliations = []
         authors=[]
+        idxstr = [str(i+args.idx) for i in range(len(affidict))]
         for k,v in authdict.items():
-            author = r'\author[%s]{%s}'%(','.join([str(_v+args.idx) for _v in v]),k)
+            author = r'\author[%s]{%s}'%(','.join(idxstr[_v] for _v in v),k)
             authors.append(author)
 
-        for k,v in affidict.items():
-            affiliation = affiltext%(v+args.idx,k)
+        for i, k in enumerate(affidict, args.idx):
+            affiliation = affiltext%(i,k)
             affiliations.append(affiliation)
 
         params = dict(defaults,authors='\n'.join(authors).strip(','),affiliations='\n'.join(affiliations))
@@ -651,78 +674,66 @@ if __name__ == "__main__":
         authlist = elsevier_authlist
         affilmark = r'%i,'
         affiltext = r'\affiliation[%i]{%s}'
-        for i,d in enumerate(data):
-            if d['Affiliation'] == '':
-                logging.warn("Blank affiliation for '%s'"%d['Authorname'])
-            if d['Authorname'] == '':
-                logging.warn("Blank authorname for '%s %s'"%(d['Firstname'],
-                                                             d['Lastname']))
-
-            authorkey = '{%s}'%(d['Authorname'])
+        orcid = args.orcid
+        names = data['Authorname'].tolist()
+        affs  = data['Affiliation'].tolist()
+        orcids = data['ORCID'].tolist() if orcid else ['']*len(data)
+        for name,aff,oid in zip(names,affs,orcids):
+            authorkey = '{%s}'%(name)
 
-            if args.orcid and d['ORCID']:
-                authorkey = authorkey + '\\orcidlink{%s}'%d['ORCID'] 
+            if oid:
+                authorkey = authorkey + '\\orcidlink{%s}'%oid
 
-            if (d['Affiliation'] not in affidict.keys()):
-                affidict[d['Affiliation']] = len(affidict.keys())
-            affidx = affidict[d['Affiliation']]
+            affidx = affidict.setdefault(aff, len(affidict))
 
-            if authorkey not in authdict.keys():
-                authdict[authorkey] = [affidx]
-            else:
-                authdict[authorkey].append(affidx)
+            authdict.setdefault(authorkey,[]).append(affidx)
 
 
         affiliations = []
         authors=[]
+        idxstr = [str(i+args.idx) for i in range(len(affidict))]
         for k,v in authdict.items():
-            author = r'\author[%s]{%s,}'%(','.join([str(_v+args.idx) for _v in v]),k)
+            author = r'\author[%s]{%s,}'%(','.join(idxstr[_v] for _v in v),k)
             authors.append(author)
 
-        for k,v in affidict.items():
-            affiliation = affiltext%(v+args.idx,k)
+        for i, k in enumerate(affidict, args.idx):
+            affiliation = affiltext%(i,k)
             affiliations.append(affiliation)
 
         params = dict(defaults,authors='\n'.join(authors).strip(','),affiliations='\n'.join(affiliations))
 
 
     ### JCAP.appendix ###
-    if cls in ['jcap.appendix']:
+    if is_jcap_appendix:
         document = elsevier_document
         authlist = jcapappendix_authlist
         affilist = jcapappendix_affilist
         affilmark = r'%i,'
         affiltext = r'\noindent \hangindent=.5cm $^{%i}${%s}'
-        for i,d in enumerate(data):
-            if d['Affiliation'] == '':
-                logging.warn("Blank affiliation for '%s'"%d['Authorname'])
-            if d['Authorname'] == '':
-                logging.warn("Blank authorname for '%s %s'"%(d['Firstname'],
-                                                             d['Lastname']))
-
-            authorkey = '{%s}'%(d['Authorname'])
+        orcid = args.orcid
+        names = data['Authorname'].tolist()
+        affs  = data['Affiliation'].tolist()
+        orcids = data['ORCID'].tolist() if orcid else ['']*len(data)
+        for name,aff,oid in zip(names,affs,orcids):
+            authorkey = '{%s}'%(name)
 
-            if args.orcid and d['ORCID']:
-                authorkey = authorkey + '\\orcidlink{%s}'%d['ORCID'] 
+            if oid:
+                authorkey = authorkey + '\\orcidlink{%s}'%oid
 
-            if (d['Affiliation'] not in affidict.keys()):
-                affidict[d['Affiliation']] = len(affidict.keys())
-            affidx = affidict[d['Affiliation']]
+            affidx = affidict.setdefault(aff, len(affidict))
 
-            if authorkey not in authdict.keys():
-                authdict[authorkey] = [affidx]
-            else:
-                authdict[authorkey].append(affidx)
+            authdict.setdefault(authorkey,[]).append(affidx)
 
 
         affiliations = []
         authors=[]
+        idxstr = [str(i+args.idx) for i in range(len(affidict))]
         for k,v in authdict.items():
-            author = r'\author[%s]{%s,}'%(','.join([str(_v+args.idx) for _v in v]),k)
+            author = r'\author[%s]{%s,}'%(','.join(idxstr[_v] for _v in v),k)
             authors.append(author)
 
-        for k,v in affidict.items():
-            affiliation = affiltext%(v+args.idx,k)
+        for i, k in enumerate(affidict, args.idx):
+            affiliation = affiltext%(i,k)
             affiliations.append(affiliation)
 
 
@@ -731,71 +742,89 @@ if __name__ == "__main__":
 
 
     ### ARXIV ###
-    if cls in ['arxiv']:
+    if is_arxiv:
         document = arxiv_document
         if args.sort:
             authlist = '%(collaboration)s: ' + arxiv_authlist
         else:
             authlist = arxiv_authlist + ' (%(collaboration)s)'
 
-        for i,d in enumerate(data):
-            if d['Authorname'] == '':
-                logging.warn("Blank authorname for '%s %s'"%(d['Firstname'],
-                                                             d['Lastname']))
-            if (d['Affiliation'] not in affidict.keys()):
-                affidict[d['Affiliation']] = len(affidict.keys())
-            affidx = affidict[d['Affiliation']]
+        names = data['Authorname'].tolist()
+        affs  = data['Affiliation'].tolist()
+        for name,aff in zip(names,affs):
+            affidx = affidict.setdefault(aff, len(affidict))
 
-            if d['Authorname'] not in authdict.keys():
-                authdict[d['Authorname']] = [affidx]
-            else:
-                authdict[d['Authorname']].append(affidx)
+            authdict.setdefault(name,[]).append(affidx)
 
         authors=[]
         for k,v in authdict.items():
-            author = re.sub(r'(?<!\\)~',' ',k).replace(r'\ ',' ').replace('{','').replace('}','')
+            author = TILDE.sub(' ',k).replace(r'\ ',' ').translate(BRACES)
             authors.append(author)
 
         params = dict(defaults,authors=', '.join(authors).strip(','),affiliations='')
 
-    output  = "%% Author list file generated with: %s %s \n"%(parser.prog, __version__ )
-    output += "%% %s %s \n"%(os.path.basename(sys.argv[0]),' '.join(sys.argv[1:]))
-    output += "%% Orcid numbers may need \\usepackage{orcidlink}.\n"
-    output += "%% Use \\input to call the file\n\n"
+    # Shared by the author list and the affiliations companion file
+    genline = "%% Author list file generated with: %s %s \n"%(parser.prog, __version__ )
 
-    if cls in ['jcap.appendix']: 
-        if args.sort_firsttier: output += "\\emailAdd{firsauthor@email}\n\\affiliation{Affiliations are in Appendix \\ref{sec:affiliations}}\n"
-        else: output += "\\author{{DESI Collaboration}:}\n\\emailAdd{spokespersons@desi.lbl.gov}\n\\affiliation{Affiliations are in Appendix \\ref{sec:affiliations}}\n"
+    parts  = [genline]
+    parts.append("%% %s %s \n"%(os.path.basename(sys.argv[0]),' '.join(sys.argv[1:])))
+    parts.append("%% Orcid numbers may need \\usepackage{orcidlink}.\n")
+    parts.append("%% Use \\input to call the file\n\n")
 
+    if is_jcap_appendix:
+        if args.sort_firsttier: parts.append("\\emailAdd{firsauthor@email}\n\\affiliation{Affiliations are in Appendix \\ref{sec:affiliations}}\n")
+        else: parts.append("\\author{{DESI Collaboration}:}\n\\emailAdd{spokespersons@desi.lbl.gov}\n\\affiliation{Affiliations are in Appendix \\ref{sec:affiliations}}\n")
 
+
+    # Render the author list once; --doc reuses it inside the document
+    rendered_authlist = authlist%params
     if args.doc:
-        params['authlist'] = authlist%params
-        output += document%params
+        params['authlist'] = rendered_authlist
+        parts.append(document%params)
     else:
-        output += authlist%params
-        if cls in ['jcap.appendix']: 
-            output2  = "%% Author list file generated with: %s %s \n"%(parser.prog, __version__ )
-            output2 += "%% Affiliations file. Use \\input to call it after \\appendix\n\n\n"
-            output2 += "\\section{Author Affiliations}\n\\label{sec:affiliations}\n\n"
-            output2 += affilist%params
+        parts.append(rendered_authlist)
+        # Only build the affiliations companion when it will be written
+        if is_jcap_appendix and args.outfile is not None:
+            parts2  = [genline]
+            parts2.append("%% Affiliations file. Use \\input to call it after \\appendix\n\n\n")
+            parts2.append("\\section{Author Affiliations}\n\\label{sec:affiliations}\n\n")
+            parts2.append(affilist%params)
+            output2 = ''.join(parts2)
+
+    output = ''.join(parts)
 
 
     if args.outfile is None:
-        print(output)
+        sys.stdout.write(output + '\n')
     else:
         outfile = args.outfile
-        if os.path.exists(outfile) and not args.force:
-            logging.warn("Found %s; skipping..."%outfile)
-        out = open(outfile,'w')
-        out.write(output)
-        out.close()
-        if cls in ['jcap.appendix']: 
-#            import os
-#            outfile2 = os.path.splitext(outfile)+".affiliations.tex"
-            outfile2 = outfile[:-len(".tex")] + ".affiliations.tex"
-            out2 = open(outfile2,'w')
-            out2.write(output2)
-            out2.close()
+        # Each output is staged in a temporary file and renamed into
+        # place; without --force an existing file is skipped.
+        pending = [(outfile,output)]
+        if is_jcap_appendix:
+            outfile2 = os.path.splitext(outfile)[0] + ".affiliations.tex"
+            pending.append((outfile2,output2))
+        for path,text in pending:
+            # Write to a temporary file first so readers never see a
+            # partially written author list.
+            tmp = path + '.tmp'
+            with open(tmp,'wb') as out:
+                out.write(text.encode('utf-8'))
+            if args.force:
+                os.replace(tmp,path)
+                continue
+            try:
+                # link() refuses to clobber, so an existing file is left
+                # untouched even if it appeared while we were writing
+                os.link(tmp,path)
+            except FileExistsError:
+                logging.warn("Found %s; skipping...",path)
+            finally:
+                os.unlink(tmp)
 
     if args.cntrb:
         write_contributions(args.cntrb,data)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ Generic python script.
 __author__ = "Alex Drlica-Wagner"
 import os
 import shutil
+import tempfile
 import logging
 import subprocess
 import unittest
@@ -24,22 +25,21 @@ class TestAuthlist(unittest.TestCase):
         self.pdf = self.csv.replace('.csv','.pdf')
         self.files = dict(self.__dict__)
 
-        cmd = "cp " + ' '.join(['data/'+f for f in [self.csv,self.order]+self.cls]) + ' .'
-        print(cmd)
-        out = subprocess.check_output(cmd,shell=True)
+        # Run each test in its own scratch directory so tests never trip
+        # over each other's outputs (and can run in parallel).
+        self.datadir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                    '..','data')
+        self.origdir = os.getcwd()
+        self.workdir = tempfile.mkdtemp()
+        os.chdir(self.workdir)
 
-        #for filename in [self.csv]+self.cls:
-        #    shutil.copy(os.path.join('data',filename),'.')
+        for filename in [self.csv,self.order]+self.cls:
+            shutil.copy(os.path.join(self.datadir,filename),'.')
 
     def tearDown(self):
-        """Remove intermediate files."""
-        self.clean = [self.csv,self.tex,self.aux,self.out,self.log,self.bib,
-                      self.pdf,self.order,self.cntrb]
-        self.clean += self.cls
-
-        cmd = "rm -f "+' '.join(self.clean)
-        print(cmd)
-        subprocess.check_output(cmd,shell=True)
+        """Remove the scratch directory and its intermediate files."""
+        os.chdir(self.origdir)
+        shutil.rmtree(self.workdir)
 
     def latex(self, tex=None, pdf=None):
         if tex is None: tex = self.tex
@@ -48,7 +48,8 @@ class TestAuthlist(unittest.TestCase):
         cmd = "pdflatex -interaction=nonstopmode %s"%(tex)
         print(cmd)
         out = subprocess.check_output(cmd,shell=True)
-        shutil.copy(tex.replace('.tex','.pdf'),pdf)
+        # Keep the built pdf after the scratch directory is removed
+        shutil.copy(tex.replace('.tex','.pdf'),os.path.join(self.origdir,pdf))
         
     def test_mkauthlist(self):
         """Run 'vanilla' mkauthlist."""
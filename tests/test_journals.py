@@ -5,6 +5,7 @@ Python test script
 __author__ = "Alex Drlica-Wagner"
 import os
 import shutil
+import tempfile
 import logging
 import subprocess
 import unittest
@@ -29,20 +30,20 @@ class TestJournal(unittest.TestCase):
 
         self.files = dict(self.__dict__)
 
-        cmd = "cp " + ' '.join(['data/'+f for f in [self.csv]+self.cls]) + ' .'
-        print(cmd)
-        out = subprocess.check_output(cmd,shell=True)
+        # Run each test in its own scratch directory so tests never trip
+        # over each other's outputs (and can run in parallel).
+        self.datadir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                    '..','data')
+        self.origdir = os.getcwd()
+        self.workdir = tempfile.mkdtemp()
+        os.chdir(self.workdir)
 
-        #for filename in [self.csv]+self.cls:
-        #    shutil.copy(os.path.join('data',filename),'.')
+        for filename in [self.csv]+self.cls:
+            shutil.copy(os.path.join(self.datadir,filename),'.')
 
     def tearDown(self):
-        self.clean = [self.csv,self.tex,self.aux,self.out,self.log,self.bib,self.pdf]
-        self.clean += self.cls
-
-        cmd = "rm -f "+' '.join(self.clean)
-        print(cmd)
-        subprocess.check_output(cmd,shell=True)
+        os.chdir(self.origdir)
+        shutil.rmtree(self.workdir)
 
     def latex(self, tex=None, pdf=None):
         if tex is None: tex = self.tex
@@ -51,7 +52,8 @@ class TestJournal(unittest.TestCase):
         cmd = "pdflatex -interaction=nonstopmode %s"%(tex)
         print(cmd)
         out = subprocess.check_output(cmd, shell=True)
-        shutil.copy(tex.replace('.tex','.pdf'), pdf)
+        # Keep the built pdf after the scratch directory is removed
+        shutil.copy(tex.replace('.tex','.pdf'), os.path.join(self.origdir,pdf))
 
     def test_mkauthlist(self):
         cmd = "mkauthlist -f --doc %(csv)s %(tex)s"%self.files
@@ -99,7 +101,7 @@ class TestJournal(unittest.TestCase):
         cmd = "mkauthlist -f -j arxiv %(csv)s %(tex)s"%self.files
         print(cmd)
         subprocess.check_output(cmd,shell=True)
-        shutil.copy(self.tex,'test_arxiv.txt')
+        shutil.copy(self.tex,os.path.join(self.origdir,'test_arxiv.txt'))
 
     def test_aanda(self):
         cmd = "mkauthlist -f --doc -j aanda %(csv)s %(tex)s"%self.files